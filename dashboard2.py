@@ -10,6 +10,8 @@ import xlsxwriter
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 import os
+from tableaux import afficher_tableau_pagine
+from entrepot import ouvrir_entrepot, selectionner, compter, executer
 
 
 # Fonction pour calculer la durée de travail
@@ -65,28 +67,6 @@ def get_correct_and_incorrect_pointages(df):
     
     return list(operateurs_corrects), list(operateurs_incorrects)
 
-# Fonction pour créer les colonnes 'Date et heure_entree' et 'Date et heure_sortie'
-def create_entry_exit_columns(df):
-    # Créer des colonnes vides pour l'entrée et la sortie
-    df['Date et heure_entree'] = pd.NaT
-    df['Date et heure_sortie'] = pd.NaT
-
-    # Remplir les colonnes en fonction de l'action
-    mask_entree = df['Action'] == 'Pointer entrée'
-    mask_sortie = df['Action'] == 'Pointer sortie'
-
-    df.loc[mask_entree, 'Date et heure_entree'] = df.loc[mask_entree, 'Date et heure']
-    df.loc[mask_sortie, 'Date et heure_sortie'] = df.loc[mask_sortie, 'Date et heure']
-
-    # Grouper par 'Prénom et nom' pour avoir une ligne par personne avec entrée et sortie
-    df_grouped = df.groupby('Prénom et nom').agg({
-        'Date et heure_entree': 'first',  # Première entrée enregistrée
-        'Date et heure_sortie': 'last',  # Dernière sortie enregistrée
-        'PIN': 'first'  # Conserver le PIN de l'employé
-    }).reset_index()
-
-    return df_grouped
-
 def get_entry_exit_times(df):
     # Trier le DataFrame par employé et date/heure
     df = df.sort_values(['Prénom et nom', 'Date et heure'])
@@ -120,23 +100,50 @@ def get_entry_exit_times(df):
                     entry_time = None
     
     return pd.DataFrame({'Prénom et nom': noms,'Entrée': entries,'Sortie': exits,'Durée (heures)': durees})
-                       
+
+# Fonction pour calculer les durées de travail dans l'entrepôt (mêmes règles que get_entry_exit_times) :
+# par opérateur, seule la première action d'une suite d'entrées ou de sorties compte, et chaque entrée
+# retenue est associée à la sortie qui la suit si elle a lieu moins d'un jour après
+def durees_de_travail(entrepot):
+    if isinstance(entrepot, pd.DataFrame):
+        return get_entry_exit_times(entrepot[['Prénom et nom', 'Date et heure', 'Action']])
+    requete = """
+        WITH actions AS (
+            SELECT "Prénom et nom" AS nom, "Date et heure" AS t, "Action" AS action,
+                   lag("Action") OVER (PARTITION BY "Prénom et nom" ORDER BY "Date et heure", file_row_number) AS precedente,
+                   file_row_number
+            FROM donnees_numerotees
+            WHERE "Action" IN ('Pointer entrée', 'Pointer sortie')
+              AND "Prénom et nom" IS NOT NULL AND "Date et heure" IS NOT NULL
+        ), paires AS (
+            SELECT nom, action, t AS entree,
+                   lead(t) OVER (PARTITION BY nom ORDER BY t, file_row_number) AS sortie
+            FROM actions
+            WHERE precedente IS DISTINCT FROM action
+        )
+        SELECT nom AS "Prénom et nom", entree AS "Entrée", sortie AS "Sortie",
+               round_even(date_diff('microsecond', entree, sortie) / 3600e6, 2) AS "Durée (heures)"
+        FROM paires
+        WHERE action = 'Pointer entrée' AND sortie IS NOT NULL
+          AND date_diff('microsecond', entree, sortie) <= 86400e6
+        ORDER BY ALL
+    """
+    return executer(entrepot, requete)
+
 # Dans la partie principale de votre application Streamlit
 st.title("Analyse des pointages")
 
 # Ajouter un widget pour télécharger le fichier Excel
 
 fichier_principal = "https://docs.google.com/spreadsheets/d/152ktjGubNDIr1PPG04mqJwZf9mhYTHmQ/export?format=xlsx"
-uploaded_file = pd.read_excel("https://docs.google.com/spreadsheets/d/152ktjGubNDIr1PPG04mqJwZf9mhYTHmQ/export?format=xlsx")
-df = charger_donnees(fichier_principal)
-df['Date et heure'] = pd.to_datetime(df['Date et heure'], errors='coerce')
+entrepot = ouvrir_entrepot(fichier_principal, colonnes_dates=('Date et heure',))
 
 # Titre de l'application
 st.title("Répartition des Durées Totales par Employé")
 # Tri des données
 
-# Afficher les opérateurs avec leurs entrées/sorties
-result = get_entry_exit_times(df)
+# Afficher les opérateurs avec leurs entrées/sorties (associées dans l'entrepôt)
+result = durees_de_travail(entrepot)
 st.subheader("Opérateurs avec entrées/sorties et durées total mensuelles")
 resultat = result.groupby('Prénom et nom')['Durée (heures)'].sum().reset_index()
 resultat = resultat.rename(columns={'Durée (heures)':'Durée Total'})
@@ -178,21 +185,14 @@ st.plotly_chart(fig, use_container_width=True)
 
 # Ajout d'une section pour afficher les données brutes
 if st.checkbox("Afficher les données brutes"):
-    st.write(df)
+    afficher_tableau_pagine(entrepot, cle="donnees_brutes")
 
 
 if fichier_principal is not None:
-    # Charger les données depuis le fichier téléchargé
-    df = charger_donnees(fichier_principal)
-    
-    if df is not None:
+    if entrepot is not None:
         st.success("Données chargées avec succès !")
 
-        # Créer les colonnes d'entrée/sortie
-        df_with_entry_exit = create_entry_exit_columns(df)
-
-        # Afficher les opérateurs avec leurs entrées/sorties
-        result = get_entry_exit_times(df)
+        # Afficher les opérateurs avec leurs entrées/sorties (durées déjà calculées ci-dessus)
         st.subheader("Opérateurs avec entrées/sorties et durées total mensuelles")
         resultat = result.groupby('Prénom et nom')['Durée (heures)'].sum().reset_index()
         resultat = resultat.rename(columns={'Durée (heures)':'Durée Mensuelle Total'})
@@ -205,7 +205,7 @@ else:
         
 st.title("Analyse des pointages - Janvier 2025")
 
-operateurs_corrects, operateurs_incorrects = get_correct_and_incorrect_pointages(df)
+operateurs_corrects, operateurs_incorrects = get_correct_and_incorrect_pointages(compter(entrepot, ['Prénom et nom', 'Action']))
 
 col1, col2 = st.columns(2)
 
@@ -220,8 +220,13 @@ with col2:
         for operateur in operateurs_incorrects:
             st.write(f"- {operateur}")
         
-# Filtrer les données pour janvier 2025
-df_janvier = df[df['Date et heure'].dt.month == 1]
+# Filtrer les données de janvier à la lecture (seules les colonnes utiles sont lues)
+filtres_janvier = [('Date et heure', 'mois', 1)]
+df_janvier = selectionner(entrepot, colonnes=['Prénom et nom', 'Date et heure', 'Statut'], filtres=filtres_janvier)
+
+if df_janvier.empty:
+    st.info("Aucun pointage en janvier dans le fichier.")
+    st.stop()
 
 col3, col4 = st.columns(2)
 
@@ -233,15 +238,6 @@ with col3:
     st.bar_chart(pointages_par_jour)
 
 with col4:
-    # Calculer le taux de succès
-    total_actions = len(df)
-    actions_succes = len(df[df['Statut'] == 'Succès'])
-    success_rate = (actions_succes / total_actions) * 100
-    failure_rate = 100 - success_rate
-
-    # Création du camembert 3D
-    fig, ax = plt.subplots(figsize=(8, 6), subplot_kw=dict(projection='3d'))
-
     # Taux de succès
     st.header("Taux de succès")
     taux_succes = (df_janvier['Statut'] == 'Succès').mean() * 100
@@ -263,9 +259,6 @@ with col4:
     # Affichage du camembert dans Streamlit
     st.pyplot(fig)
 
-    result = get_entry_exit_times(df)
-    print(result)
-
 # Observations particulières
 st.header("Observations particulières")
 observations = [
@@ -282,4 +275,4 @@ for obs in observations:
 # Affichage des données brutes
 if st.checkbox("Afficher les données brutes de janvier"):
     st.subheader("Données brutes de janvier 2025")
-    st.write(df_janvier)
+    afficher_tableau_pagine(entrepot, cle="donnees_brutes_janvier", filtres=filtres_janvier)
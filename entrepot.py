@@ -0,0 +1,247 @@
+import hashlib
+import operator
+import os
+from datetime import date, datetime, timedelta
+import pandas as pd
+import streamlit as st
+
+# DuckDB est optionnel : sans lui, les requêtes sont exécutées en pandas sur une copie partagée des données
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+DOSSIER_INSTANTANES = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".instantanes")
+
+OPERATEURS_PANDAS = {
+    "=": operator.eq, "!=": operator.ne, "<": operator.lt,
+    "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+}
+
+# Expressions SQL des périodes, identiques aux libellés produits par pandas (to_period)
+PERIODES_SQL = {
+    "Jour": "CAST({col} AS DATE)",
+    "Semaine": "strftime(date_trunc('week', {col}), '%Y-%m-%d') || '/' || strftime(date_trunc('week', {col}) + INTERVAL 6 DAY, '%Y-%m-%d')",
+    "Mois": "strftime({col}, '%Y-%m')",
+    "Trimestre": "CAST(year({col}) AS VARCHAR) || 'Q' || CAST(quarter({col}) AS VARCHAR)",
+    "Année": "year({col})",
+}
+
+# Fonction pour calculer une période à partir d'une colonne de dates (équivalent pandas de PERIODES_SQL)
+def periode_pandas(dates, periode):
+    if periode == "Jour":
+        return dates.dt.normalize()
+    if periode == "Semaine":
+        return dates.dt.to_period('W').astype(str)
+    if periode == "Mois":
+        return dates.dt.to_period('M').astype(str)
+    if periode == "Trimestre":
+        return dates.dt.to_period('Q').astype(str)
+    return dates.dt.year
+
+# Fonction pour ouvrir l'entrepôt de données d'une source, partagé en lecture seule par toutes les sessions
+@st.cache_resource
+def ouvrir_entrepot(source, colonnes_dates=()):
+    df = pd.read_excel(source)
+    # Les colonnes de dates peuvent être données par nom ou par position ; les colonnes absentes sont
+    # ignorées, la vérification du format attendu revenant à la page
+    for col in colonnes_dates:
+        col = df.columns[col] if isinstance(col, int) and col < len(df.columns) else col
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    if duckdb is None:
+        return df
+
+    # Instantané colonnaire local : les requêtes ne lisent que les colonnes et lignes nécessaires
+    os.makedirs(DOSSIER_INSTANTANES, exist_ok=True)
+    # Un instantané par source et par conversion de dates, pour ne jamais remplacer le fichier lu par un autre entrepôt
+    cle_instantane = f"{source}|{list(colonnes_dates)}"
+    chemin = os.path.join(DOSSIER_INSTANTANES, hashlib.sha1(cle_instantane.encode()).hexdigest() + ".parquet")
+    chemin_temporaire = f"{chemin}.{os.getpid()}.tmp"
+    chemin_sql, chemin_temporaire_sql = chemin.replace("'", "''"), chemin_temporaire.replace("'", "''")
+    con = duckdb.connect()
+    try:
+        con.register("source_df", df)
+        con.execute(f"COPY source_df TO '{chemin_temporaire_sql}' (FORMAT PARQUET)")
+        con.unregister("source_df")
+        os.replace(chemin_temporaire, chemin)
+        con.execute(f"CREATE VIEW donnees AS SELECT * FROM read_parquet('{chemin_sql}')")
+        # Vue numérotée dans l'ordre du fichier, pour un ordre stable entre les pages d'un tableau
+        con.execute(f"CREATE VIEW donnees_numerotees AS SELECT * FROM read_parquet('{chemin_sql}', file_row_number = true)")
+    except (duckdb.Error, OSError) as e:
+        st.warning(f"Instantané DuckDB indisponible, utilisation de pandas : {e}")
+        con.close()
+        return df
+    return con
+
+# Fonction pour exécuter une requête SQL sur un curseur dédié (une connexion partagée n'est pas sûre entre threads)
+def executer(entrepot, requete, parametres=()):
+    with entrepot.cursor() as curseur:
+        return curseur.execute(requete, list(parametres)).df()
+
+# Fonctions pour citer un nom de colonne SQL et préparer une valeur de filtre
+def citer(colonne):
+    return '"' + str(colonne).replace('"', '""') + '"'
+
+def normaliser_valeur(valeur):
+    # Une date seule est comparée à minuit, comme le fait pandas avec pd.Timestamp
+    if isinstance(valeur, date) and not isinstance(valeur, datetime):
+        return datetime.combine(valeur, datetime.min.time())
+    if isinstance(valeur, pd.Timestamp):
+        return valeur.to_pydatetime()
+    return valeur
+
+# Fonction pour traduire les filtres [(colonne, opérateur, valeur), ...] en clause WHERE
+# (l'opérateur "mois" compare le mois, de 1 à 12, d'une colonne de dates)
+def clause_where(filtres):
+    conditions, parametres = [], []
+    for col, op, valeur in filtres or []:
+        if op == "in":
+            valeurs = list(valeur)
+            if not valeurs:
+                conditions.append("FALSE")
+                continue
+            conditions.append(f"{citer(col)} IN ({', '.join('?' * len(valeurs))})")
+            parametres.extend(normaliser_valeur(v) for v in valeurs)
+        elif op == "mois":
+            conditions.append(f"month({citer(col)}) = ?")
+            parametres.append(int(valeur))
+        elif op in OPERATEURS_PANDAS:
+            conditions.append(f"{citer(col)} {op} ?")
+            parametres.append(normaliser_valeur(valeur))
+        else:
+            raise ValueError(f"Opérateur de filtre inconnu : {op}")
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), parametres
+
+# Fonction pour appliquer les mêmes filtres en pandas
+def masque_pandas(df, filtres):
+    masque = pd.Series(True, index=df.index)
+    for col, op, valeur in filtres or []:
+        if op == "in":
+            masque &= df[col].isin([normaliser_valeur(v) for v in valeur])
+        elif op == "mois":
+            masque &= df[col].dt.month == int(valeur)
+        elif op in OPERATEURS_PANDAS:
+            masque &= OPERATEURS_PANDAS[op](df[col], normaliser_valeur(valeur))
+        else:
+            raise ValueError(f"Opérateur de filtre inconnu : {op}")
+    return masque
+
+# Fonction pour chercher un texte (sans tenir compte de la casse) dans les colonnes textuelles, en pandas
+def masque_recherche(df, texte):
+    masque = pd.Series(False, index=df.index)
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        masque |= df[col].astype(str).str.contains(texte, case=False, regex=False, na=False)
+    return masque
+
+# Fonction pour construire la clause WHERE des filtres et de la recherche de texte
+def clause_where_recherche(entrepot, filtres, recherche):
+    where, parametres = clause_where(filtres)
+    if not recherche:
+        return where, parametres
+    colonnes_texte = executer(entrepot, "DESCRIBE donnees").query("column_type == 'VARCHAR'")['column_name']
+    conditions = [f"contains(lower({citer(c)}), lower(?))" for c in colonnes_texte]
+    condition = "(" + " OR ".join(conditions) + ")" if conditions else "FALSE"
+    return (where + " AND " if where else " WHERE ") + condition, parametres + [recherche] * len(conditions)
+
+# Fonction pour lister les colonnes disponibles
+def colonnes(entrepot):
+    if isinstance(entrepot, pd.DataFrame):
+        return entrepot.columns.tolist()
+    return executer(entrepot, "SELECT * FROM donnees LIMIT 0").columns.tolist()
+
+# Fonction pour sélectionner des lignes et des colonnes, les filtres étant appliqués à la lecture.
+# `recherche` cherche un texte dans les colonnes textuelles, `ordre` est un couple (colonne, croissant),
+# `limite` et `decalage` ne renvoient qu'une page de lignes
+def selectionner(entrepot, colonnes=None, filtres=None, recherche=None, ordre=None, limite=None, decalage=0):
+    if isinstance(entrepot, pd.DataFrame):
+        masque = masque_pandas(entrepot, filtres)
+        if recherche:
+            masque &= masque_recherche(entrepot, recherche)
+        df = entrepot.loc[masque, colonnes if colonnes is not None else entrepot.columns]
+        if ordre is not None:
+            colonne, croissant = ordre
+            try:
+                df = df.sort_values(colonne, ascending=croissant, kind='mergesort', na_position='last')
+            except TypeError:
+                # Colonne aux types mélangés (texte et nombres) : tri sur la représentation texte
+                df = df.sort_values(colonne, ascending=croissant, kind='mergesort', na_position='last', key=lambda s: s.astype(str))
+        if limite is not None:
+            df = df.iloc[decalage:decalage + limite]
+        return df.copy()
+
+    where, parametres = clause_where_recherche(entrepot, filtres, recherche)
+    select = ", ".join(citer(c) for c in colonnes) if colonnes is not None else "*"
+    if ordre is None and limite is None:
+        return executer(entrepot, f"SELECT {select} FROM donnees{where}", parametres)
+
+    # Tri et pagination exécutés par DuckDB, le numéro de ligne départageant les égalités
+    if colonnes is None:
+        select = "* EXCLUDE (file_row_number)"
+    tri = "file_row_number"
+    if ordre is not None:
+        colonne, croissant = ordre
+        tri = f"{citer(colonne)} {'ASC' if croissant else 'DESC'} NULLS LAST, {tri}"
+    requete = f"SELECT {select} FROM donnees_numerotees{where} ORDER BY {tri}"
+    if limite is not None:
+        requete += " LIMIT ? OFFSET ?"
+        parametres = parametres + [int(limite), int(decalage)]
+    return executer(entrepot, requete, parametres)
+
+# Fonction pour compter les lignes par groupe, avec une période optionnelle (colonne de dates, nom de période)
+def compter(entrepot, par, filtres=None, periode=None, nom='Repetitions'):
+    filtres = list(filtres or [])
+    if isinstance(entrepot, pd.DataFrame):
+        masque = masque_pandas(entrepot, filtres)
+        if periode is not None:
+            # Comme en SQL (IS NOT NULL), les dates manquantes sont écartées avant le calcul de la période
+            masque &= entrepot[periode[0]].notna()
+        df = entrepot.loc[masque]
+        cles = [df[c] for c in par]
+        if periode is not None:
+            col_date, nom_periode = periode
+            cles.append(periode_pandas(df[col_date], nom_periode).rename(nom_periode))
+        return df.groupby(cles).size().reset_index(name=nom)
+
+    expressions = [citer(c) for c in par]
+    where, parametres = clause_where(filtres)
+    # Comme pandas, les groupes sans clé (valeurs manquantes) sont ignorés
+    conditions = [f"{citer(c)} IS NOT NULL" for c in par]
+    if periode is not None:
+        col_date, nom_periode = periode
+        expressions.append(f"{PERIODES_SQL[nom_periode].format(col=citer(col_date))} AS {citer(nom_periode)}")
+        conditions.append(f"{citer(col_date)} IS NOT NULL")
+    if conditions:
+        where = (where + " AND " if where else " WHERE ") + " AND ".join(conditions)
+    requete = f"SELECT {', '.join(expressions)}, COUNT(*) AS {citer(nom)} FROM donnees{where} GROUP BY ALL ORDER BY ALL"
+    return executer(entrepot, requete, parametres)
+
+# Fonction pour compter le nombre total de lignes
+def nombre_lignes(entrepot, filtres=None, recherche=None):
+    if isinstance(entrepot, pd.DataFrame):
+        masque = masque_pandas(entrepot, filtres)
+        if recherche:
+            masque &= masque_recherche(entrepot, recherche)
+        return int(masque.sum())
+    where, parametres = clause_where_recherche(entrepot, filtres, recherche)
+    return int(executer(entrepot, f"SELECT COUNT(*) AS n FROM donnees{where}", parametres)['n'].iloc[0])
+
+# Fonction pour obtenir la valeur minimale et maximale d'une colonne
+def bornes(entrepot, colonne, filtres=None):
+    if isinstance(entrepot, pd.DataFrame):
+        valeurs = entrepot.loc[masque_pandas(entrepot, filtres), colonne]
+        return valeurs.min(), valeurs.max()
+    where, parametres = clause_where(filtres)
+    resultat = executer(entrepot, f"SELECT MIN({citer(colonne)}) AS min, MAX({citer(colonne)}) AS max FROM donnees{where}", parametres)
+    return resultat['min'].iloc[0], resultat['max'].iloc[0]
+
+# Fonction pour lister les valeurs distinctes (non vides) d'une colonne, triées
+def valeurs_distinctes(entrepot, colonne):
+    if isinstance(entrepot, pd.DataFrame):
+        return sorted(entrepot[colonne].dropna().unique().tolist())
+    requete = f"SELECT DISTINCT {citer(colonne)} AS v FROM donnees WHERE {citer(colonne)} IS NOT NULL ORDER BY 1"
+    return executer(entrepot, requete)['v'].tolist()
+
+# Fonction pour construire les filtres d'une période de jours entiers (du début au fin inclus)
+def filtres_periode(colonne, debut, fin):
+    return [(colonne, ">=", debut), (colonne, "<", normaliser_valeur(fin) + timedelta(days=1))]
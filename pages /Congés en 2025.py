@@ -4,16 +4,17 @@ import plotly.graph_objects as go
 import calendar
 from datetime import datetime, timedelta
 import plotly.express as px
+from entrepot import ouvrir_entrepot, colonnes, selectionner, nombre_lignes
 
 # Configuration de la page Streamlit
 st.set_page_config(page_title="Calendrier des Congés 2025", layout="wide")
 st.title("Calendrier des Congés 2025")
 
-# Fonction pour charger les données depuis le fichier Excel
-@st.cache_data
+# Fonction pour ouvrir l'entrepôt des congés depuis le fichier Excel
 def load_data(file_path):
     try:
-        df = pd.read_excel(file_path)
+        # Les colonnes 'Début' et 'Fin' sont converties en format datetime
+        entrepot = ouvrir_entrepot(file_path, colonnes_dates=('Début', 'Fin'))
     except Exception as e:
         st.error(f"Erreur lors de la lecture du fichier Excel : {e}")
         return None
@@ -22,28 +23,27 @@ def load_data(file_path):
     expected_columns = ['Prénom et nom', 'Type', 'Type de congé', 'Début', 'Fin',
                         'Succursale', 'Position', 'Ressources', 'Total (h)', 'Note',
                         '# de la demande', 'Créée le', 'Approuvé à', 'Approbateur', 'Justification']
-    if not all(col in df.columns for col in expected_columns):
+    colonnes_fichier = colonnes(entrepot)
+    if not all(col in colonnes_fichier for col in expected_columns):
         st.error("Les colonnes du fichier ne correspondent pas au format attendu.")
         return None
 
-    return df
+    return entrepot
+
+# Fonction pour sélectionner les congés qui chevauchent une période (du début à la fin inclus)
+def conges_sur_periode(entrepot, debut, fin, colonnes=None):
+    filtres = [('Début', '<', fin + timedelta(days=1)), ('Fin', '>=', debut)]
+    return selectionner(entrepot, colonnes=colonnes, filtres=filtres)
 
 # URL du fichier Excel (Google Sheets exporté en .xlsx)
 file_path = "https://docs.google.com/spreadsheets/d/1IO_1-v5i0IZQSF6UUfYEuKlTn6i-3hSI/export?format=xlsx"
-df = load_data(file_path)
+entrepot = load_data(file_path)
 
-# Vérifier si le DataFrame a été chargé correctement
-if df is None or df.empty:
+# Vérifier si les données ont été chargées correctement
+if entrepot is None or nombre_lignes(entrepot) == 0:
     st.warning("Aucune donnée à afficher.")
     st.stop()
 
-# Convertir les colonnes 'Début' et 'Fin' en format datetime
-df['Début'] = pd.to_datetime(df['Début'], errors='coerce')
-df['Fin'] = pd.to_datetime(df['Fin'], errors='coerce')
-
-# Filtrer les congés pour l'année 2025
-df = df[(df['Début'].dt.year == 2025) | (df['Fin'].dt.year == 2025)]
-
 # Fonction pour créer un calendrier mensuel sous forme de grille
 def create_month_grid(year, month, data):
     # Récupérer le premier jour du mois et le nombre de jours dans le mois
@@ -120,8 +120,11 @@ def create_month_grid(year, month, data):
 # Affichage de l'interaction avec les mois et les années
 month_select = st.selectbox("Choisir un mois", options=range(1, 13), format_func=lambda x: calendar.month_name[x])
 
-# Créer le calendrier interactif pour le mois sélectionné
-fig = create_month_grid(2025, month_select, df)
+# Créer le calendrier interactif pour le mois sélectionné (seuls les congés de ce mois sont lus)
+debut_mois = datetime(2025, month_select, 1).date()
+fin_mois = datetime(2025, month_select, calendar.monthrange(2025, month_select)[1]).date()
+df_mois = conges_sur_periode(entrepot, debut_mois, fin_mois, colonnes=['Début', 'Fin'])
+fig = create_month_grid(2025, month_select, df_mois)
 
 # Afficher le calendrier dans Streamlit
 st.plotly_chart(fig)
@@ -129,7 +132,8 @@ st.plotly_chart(fig)
 # Détails du congé sélectionné
 st.subheader("Détails des Congés")
 selected_date = st.date_input("Sélectionner une date", min_value=datetime(2025, 1, 1), max_value=datetime(2025, 12, 31))
-selected_day_conges = df[(df['Début'].dt.date <= selected_date) & (df['Fin'].dt.date >= selected_date)]
+selected_day_conges = conges_sur_periode(entrepot, selected_date, selected_date,
+                                         colonnes=['Prénom et nom', 'Type de congé', 'Justification', 'Début', 'Fin'])
 
 if selected_day_conges.empty:
     st.write(f"Aucun congé programmé pour le {selected_date}.")
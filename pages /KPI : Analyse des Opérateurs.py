@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import streamlit as st
 import plotly.graph_objects as go
 from io import BytesIO
@@ -7,11 +8,10 @@ from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 import plotly.express as px
 import os
-
-# Fonction de chargement des données
-@st.cache_data
-def charger_donnees(fichier):
-    return pd.read_excel(fichier)
+import random
+import threading
+from tableaux import afficher_tableau_pagine
+from entrepot import ouvrir_entrepot, colonnes, selectionner, compter, bornes, valeurs_distinctes, filtres_periode
 
 team_1_Christian = ["Abdelaziz HANI DDAMIR", "Aboubacar TAMADOU", "Alhousseyni DIA", "Berkant INCE",
     "Boubakar Sidiki OUEDRAGO", "Boubou GASSAMA", "Chamsoudine ABDOULWAHAB", "Dagobert EWANE JENE",
@@ -59,20 +59,19 @@ def convert_df_to_xlsx(df):
 # Fonction pour appliquer des styles aux moyennes
 def style_moyennes(df, top_n=3, bottom_n=5):
     moyenne_totale = df['Repetitions'].mean()
-    df_top = df.nlargest(top_n, 'Repetitions')
-    df_bottom = df.nsmallest(bottom_n, 'Repetitions')
-
-    def apply_styles(row):
-        if row.name in df_top.index:
-            return ['background-color: gold; color: black'] * len(row)
-        elif row.name in df_bottom.index:
-            return ['background-color: lightcoral; color: white'] * len(row)
-        elif row['Repetitions'] > moyenne_totale:
-            return ['background-color: lightgreen'] * len(row)
-        else:
-            return ['background-color: lightpink'] * len(row)
-
-    styled_df = df.style.apply(apply_styles, axis=1)
+    index_top = df.nlargest(top_n, 'Repetitions').index
+    index_bottom = df.nsmallest(bottom_n, 'Repetitions').index
+
+    # Styles calculés par masques sur toute la colonne plutôt que ligne par ligne
+    def apply_styles(data):
+        styles = np.select(
+            [data.index.isin(index_top), data.index.isin(index_bottom), (data['Repetitions'] > moyenne_totale).to_numpy()],
+            ['background-color: gold; color: black', 'background-color: lightcoral; color: white', 'background-color: lightgreen'],
+            default='background-color: lightpink',
+        )
+        return pd.DataFrame(np.repeat(styles[:, None], data.shape[1], axis=1), index=data.index, columns=data.columns)
+
+    styled_df = df.style.apply(apply_styles, axis=None)
     return styled_df
 
 # Fonction pour générer un PDF
@@ -90,49 +89,151 @@ def generate_pdf(df, filename="tableau.pdf"):
     buffer.seek(0)
     return buffer.getvalue()
 
+# Fenêtres glissantes (en jours) et percentiles utilisés pour les indicateurs
+FENETRES_GLISSANTES = [7, 30, 90]
+PERCENTILES = {"p10": 0.1, "p50": 0.5, "p90": 0.9}
+
+# Fonction pour compter les interventions par jour et par opérateur (un jour par ligne, un opérateur par colonne)
+def compter_par_jour(entrepot, col_nom, col_date, depuis=None):
+    filtres = None if depuis is None else [(col_date, '>=', depuis)]
+    comptes = compter(entrepot, [col_nom], filtres=filtres, periode=(col_date, 'Jour'))
+    comptes = comptes.pivot(index='Jour', columns=col_nom, values='Repetitions').fillna(0).astype(int)
+    if comptes.empty:
+        return comptes
+    comptes.index = pd.to_datetime(comptes.index)
+    # Compléter le calendrier pour que les fenêtres glissantes portent sur des jours et non des lignes
+    return comptes.asfreq('D', fill_value=0)
+
+# Fonction pour ajouter de nouveaux jours aux comptes existants sans recompter tout l'historique
+def fusionner_comptes_journaliers(comptes, nouveaux):
+    if comptes is None or comptes.empty:
+        return nouveaux
+    if nouveaux.empty:
+        return comptes
+    # Les jours présents dans les nouveaux comptes sont recomptés entièrement et remplacent les anciens
+    comptes = comptes[comptes.index < nouveaux.index.min()]
+    fusion = pd.concat([comptes, nouveaux]).fillna(0).astype(int)
+    return fusion.asfreq('D', fill_value=0)
+
+# Fonction pour calculer les cumuls glissants 7/30/90 jours (une ligne par jour et par opérateur)
+def cumuls_glissants(comptes, depuis=None):
+    if depuis is not None:
+        # Seuls les jours à partir de `depuis` sont recalculés, avec l'historique nécessaire à la plus grande fenêtre
+        comptes = comptes[comptes.index >= depuis - pd.Timedelta(days=max(FENETRES_GLISSANTES) - 1)]
+    cumuls = pd.concat(
+        {f"{n} jours": comptes.rolling(n, min_periods=1).sum() for n in FENETRES_GLISSANTES},
+        axis=1,
+    ).stack(level=1)
+    cumuls.index.names = ['Jour', 'Prénom et nom']
+    if depuis is not None:
+        cumuls = cumuls[cumuls.index.get_level_values('Jour') >= depuis]
+    return cumuls.astype(int)
+
+# Fonction pour calculer les percentiles p10/p50/p90 par team et par jour
+def percentiles_par_team(cumuls, fenetre="30 jours"):
+    # Seuls les opérateurs actifs sur les 90 derniers jours et rattachés à une team sont pris en compte :
+    # les jours à zéro avant l'arrivée ou après le départ d'un opérateur fausseraient la distribution
+    equipes = cumuls.index.get_level_values('Prénom et nom').map(assign_team).rename('Team')
+    actifs = (cumuls['90 jours'] > 0).to_numpy() & (equipes != "Non assigné")
+    cumuls, equipes = cumuls[actifs], equipes[actifs]
+    if cumuls.empty:
+        return pd.DataFrame(columns=['Jour', 'Team'] + list(PERCENTILES.keys()))
+    percentiles = cumuls[fenetre].groupby([cumuls.index.get_level_values('Jour'), equipes]).quantile(list(PERCENTILES.values()))
+    percentiles = percentiles.unstack()
+    percentiles.columns = list(PERCENTILES.keys())
+    return percentiles.reset_index()
+
+# Fonction pour comparer les 7 derniers jours (jusqu'à `fin` inclus) aux 7 jours précédents, par opérateur
+def variations_hebdomadaires(comptes, fin):
+    # Les jours postérieurs à la fin de la période ne sont pas comptés
+    comptes = comptes[comptes.index <= pd.Timestamp(fin)]
+    fin = comptes.index.max()
+    debut = fin - pd.Timedelta(days=6)
+    debut_precedente = debut - pd.Timedelta(days=7)
+
+    derniere = comptes.loc[debut:fin].sum().astype(float)
+    precedente = comptes.loc[debut_precedente:debut - pd.Timedelta(days=1)].sum().astype(float)
+    # Une semaine dont l'historique est incomplet n'est pas comparée
+    if comptes.index.min() > debut:
+        derniere[:] = float('nan')
+    if comptes.index.min() > debut_precedente:
+        precedente[:] = float('nan')
+
+    variations = pd.DataFrame({'Interventions': derniere, 'Semaine précédente': precedente, 'Variation': derniere - precedente})
+    variations.index.name = 'Prénom et nom'
+    return variations.reset_index(), debut, fin
+
+# Indicateurs partagés par toutes les sessions d'une même source (un seul calcul par processus)
+@st.cache_resource
+def cache_kpi(source):
+    return {'verrou': threading.Lock(), 'entrepot': None, 'comptes': None, 'cumuls': None}
+
+# Fonction pour mettre à jour les indicateurs, recalculés seulement quand l'entrepôt est reconstruit
+def mettre_a_jour_kpi(entrepot, col_nom, col_date, source):
+    kpi = cache_kpi(source)
+    with kpi['verrou']:
+        # Même entrepôt : les données n'ont pas changé, aucune requête n'est nécessaire
+        if kpi['entrepot'] is entrepot:
+            return kpi
+        if kpi['comptes'] is None or kpi['comptes'].empty:
+            comptes = compter_par_jour(entrepot, col_nom, col_date)
+            cumuls = cumuls_glissants(comptes)
+        else:
+            # Entrepôt reconstruit : seuls les jours à partir du dernier jour connu (peut-être incomplet) sont recomptés.
+            # Les lignes ajoutées ou modifiées avant ce jour ne sont pas prises en compte ; vider cache_kpi
+            # (cache_kpi.clear()) force un recomptage complet de l'historique
+            dernier_jour = kpi['comptes'].index.max()
+            nouveaux = compter_par_jour(entrepot, col_nom, col_date, depuis=dernier_jour)
+            comptes = fusionner_comptes_journaliers(kpi['comptes'], nouveaux)
+            anciens = kpi['cumuls'][kpi['cumuls'].index.get_level_values('Jour') < dernier_jour]
+            cumuls = pd.concat([anciens, cumuls_glissants(comptes, depuis=dernier_jour)]).fillna(0).astype(int)
+        kpi.update(entrepot=entrepot, comptes=comptes, cumuls=cumuls)
+    return kpi
+
 # Configuration de la page Streamlit
 st.set_page_config(page_title="Analyse des Interventions", page_icon="📊", layout="wide")
 st.title("📊 Analyse des interventions des opérateurs")
 
 fichier_principal = "https://docs.google.com/spreadsheets/d/1-iyR9W5tjVIn9SuvzuYGR-Ncf6aJLE1x/export?format=xlsx"
-df_principal = charger_donnees(fichier_principal)
+# La 7e colonne contient la date de l'intervention
+entrepot = ouvrir_entrepot(fichier_principal, colonnes_dates=(6,))
 
 if fichier_principal is not None:
-    
-    df_principal['Team'] = df_principal['Prénom et nom'].apply(assign_team)
+    col_prenom_nom = colonnes(entrepot)[4]
+    col_date = colonnes(entrepot)[6]
+
+    # Indicateurs calculés sur l'historique complet, avant toute sélection d'opérateurs ou de team
+    kpi = mettre_a_jour_kpi(entrepot, col_prenom_nom, col_date, fichier_principal)
 
     col1, col2 = st.columns([2, 3])
 
     with col1:
-        col_prenom_nom = df_principal.columns[4]
-        col_date = df_principal.columns[6]
-
-        operateurs = df_principal[col_prenom_nom].unique().tolist()
-        teams = df_principal['Team'].unique().tolist()     
+        operateurs = valeurs_distinctes(entrepot, col_prenom_nom)
+        teams = list(dict.fromkeys(assign_team(operateur) for operateur in operateurs))
         teams.insert(0, "Team")
 
+        # Filtre des opérateurs pris en compte (tous, ou ceux de la team choisie)
+        filtres_perimetre = []
+
         selection_type = st.selectbox("Sélectionner par", ["Opérateur", "Team"])
         if selection_type == "Opérateur":
             operateurs_selectionnes = st.multiselect("Choisissez un ou plusieurs opérateurs", operateurs)
             if "Total" in operateurs_selectionnes:
-                operateurs_selectionnes = df_principal[col_prenom_nom].unique().tolist()
+                operateurs_selectionnes = operateurs
         else:
+            operateurs_selectionnes = []
             teams_selectionnes = st.multiselect("Choisissez une ou plusieurs teams", teams)
             if "Team 1 Christian" in teams_selectionnes:
-                df_principal = df_principal[df_principal['Team']=='Team 1 Christian']
-                teams_selectionnes = df_principal['Prénom et nom'].unique().tolist()
-                operateurs_selectionnes = df_principal[df_principal['Prénom et nom'].isin(teams_selectionnes)]['Prénom et nom'].unique().tolist()
+                operateurs_selectionnes = [operateur for operateur in operateurs if assign_team(operateur) == 'Team 1 Christian']
+                filtres_perimetre = [(col_prenom_nom, 'in', operateurs_selectionnes)]
             elif "Team 2 Hakim" in teams_selectionnes:
-                df_principal = df_principal[df_principal['Team']=='Team 2 Hakim']
-                teams_selectionnes = df_principal['Prénom et nom'].unique().tolist()
-                operateurs_selectionnes = df_principal[df_principal['Prénom et nom'].isin(teams_selectionnes)]['Prénom et nom'].unique().tolist()
+                operateurs_selectionnes = [operateur for operateur in operateurs if assign_team(operateur) == 'Team 2 Hakim']
+                filtres_perimetre = [(col_prenom_nom, 'in', operateurs_selectionnes)]
  
         periodes = ["Jour", "Semaine", "Mois", "Trimestre", "Année"]
         periode_selectionnee = st.selectbox("Choisissez une période", periodes)
 
-        df_principal[col_date] = pd.to_datetime(df_principal[col_date], errors='coerce')
-        date_min = df_principal[col_date].min()
-        date_max = df_principal[col_date].max()
+        date_min, date_max = bornes(entrepot, col_date, filtres=filtres_perimetre)
 
         if pd.isna(date_min) or pd.isna(date_max):
             st.warning("Certaines dates dans le fichier sont invalides. Elles ont été ignorées.")
@@ -143,23 +244,20 @@ if fichier_principal is not None:
 
         nombre_lignes = st.slider("Nombre de lignes à tirer au sort", min_value=1, max_value=10, value=2)
 
+    # L'analyse reste affichée tant que ses paramètres ne changent pas ; la graine garde le même tirage au sort
+    parametres_analyse = (selection_type, tuple(operateurs_selectionnes), periode_selectionnee, debut_periode, fin_periode, nombre_lignes)
     if st.button("Analyser"):
-        df_principal = df_principal.dropna(subset=[col_date])
-        df_principal['Jour'] = df_principal[col_date].dt.date
-        df_principal['Semaine'] = df_principal[col_date].dt.to_period('W').astype(str)
-        df_principal['Mois'] = df_principal[col_date].dt.to_period('M').astype(str)
-        df_principal['Trimestre'] = df_principal[col_date].dt.to_period('Q').astype(str)
-        df_principal['Année'] = df_principal[col_date].dt.year
-
-        df_graph = df_principal[(df_principal[col_date].dt.date >= debut_periode) & (df_principal[col_date].dt.date <= fin_periode)]
-        df_graph = df_graph[df_graph['Prénom et nom'].isin(operateurs_selectionnes)]
+        st.session_state['analyse_lancee'] = {'parametres': parametres_analyse, 'graine': random.randrange(2**32)}
 
-        groupby_cols = [col_prenom_nom]
-        if periode_selectionnee != "Total":
-            groupby_cols.append(periode_selectionnee)
+    analyse = st.session_state.get('analyse_lancee')
+    if analyse is not None and analyse['parametres'] == parametres_analyse:
+        # Comptages exécutés par l'entrepôt : seules les lignes filtrées sont lues
+        filtre_operateurs = (col_prenom_nom, 'in', operateurs_selectionnes)
+        filtres_graph = [filtre_operateurs] + filtres_periode(col_date, debut_periode, fin_periode)
+        periode = (col_date, periode_selectionnee)
 
-        repetitions_graph = df_graph.groupby(groupby_cols).size().reset_index(name='Repetitions')
-        repetitions_tableau = df_principal[df_principal['Prénom et nom'].isin(operateurs_selectionnes)].groupby(groupby_cols).size().reset_index(name='Repetitions')
+        repetitions_graph = compter(entrepot, [col_prenom_nom], filtres=filtres_graph, periode=periode)
+        repetitions_tableau = compter(entrepot, [col_prenom_nom], filtres=[filtre_operateurs], periode=periode)
 
         with col2:
             # Graphique principal (barres)
@@ -173,16 +271,9 @@ if fichier_principal is not None:
 
             # Calcul des moyennes par opérateur et par période
             moyennes_par_periode = repetitions_graph.groupby([periode_selectionnee, col_prenom_nom])['Repetitions'].mean().reset_index()
-            col_prenom_nom_exclus = df_principal[df_principal['Prénom et nom'].isin(team_exclus)].columns[4]
-            moyennes_par_periode_exclus = repetitions_graph.groupby([periode_selectionnee, col_prenom_nom_exclus])['Repetitions'].mean().reset_index()
             moyennes_par_operateur = moyennes_par_periode.groupby(['Prénom et nom'])['Repetitions'].mean().reset_index()
             moyenne_globale = moyennes_par_operateur['Repetitions'].mean()           
-            par_mois = df_principal.groupby(['Prénom et nom', 'Mois']).size().reset_index(name='Repetitions_Mois')
-            df_moyenne = df_principal.groupby(groupby_cols).size().reset_index(name='Repetitions')
-            moy_Mensuel = par_mois.groupby(['Prénom et nom']).mean('Repetitions_Mois')
-            moy_Mensuel = moy_Mensuel.reset_index()
-            moy_Mensuel = moy_Mensuel[moy_Mensuel['Prénom et nom'].isin(team_exclus)]
-            moy_Mensuel['Repetitions_Mois'] = pd.to_numeric(moy_Mensuel['Repetitions_Mois'], errors='coerce')
+            df_moyenne = compter(entrepot, [col_prenom_nom], filtres=filtres_perimetre, periode=periode)
             moyenne_total = df_moyenne['Repetitions'].mean()
 
 # Affichage des graphiques et tableaux côte à côte
@@ -243,18 +334,44 @@ if fichier_principal is not None:
         st.markdown(f"### La Moyenne des Opérateurs selectionnés par {periode_selectionnee} est : {moyenne_globale}")
         st.markdown(f"### La Moyenne Globale des rapports d'intervention par {periode_selectionnee} est : {moyenne_total}")
         st.write("### Tableau des rapports d'intervention par période et par opérateur")
-        st.dataframe(repetitions_tableau, use_container_width=True)
+        afficher_tableau_pagine(repetitions_tableau, cle="repetitions_tableau")
+
+        # Indicateurs glissants, variations hebdomadaires et distribution par team
+        jours_kpi = kpi['cumuls'].index.get_level_values('Jour')
+        cumuls_periode = kpi['cumuls'][(jours_kpi >= pd.Timestamp(debut_periode)) & (jours_kpi <= pd.Timestamp(fin_periode))]
+        cumuls_selection = cumuls_periode[cumuls_periode.index.get_level_values('Prénom et nom').isin(operateurs_selectionnes)].reset_index()
+
+        if not cumuls_selection.empty:
+            colonnes_selection = kpi['comptes'].columns.intersection(operateurs_selectionnes)
+            variations, debut_semaine, fin_semaine = variations_hebdomadaires(kpi['comptes'][colonnes_selection], fin_periode)
+            derniers_cumuls = cumuls_selection[cumuls_selection['Jour'] == cumuls_selection['Jour'].max()]
+            tableau_kpi = derniers_cumuls.merge(variations, on='Prénom et nom', how='left')
+
+            col_glissant, col_percentiles = st.columns(2)
+            with col_glissant:
+                fig_glissant = px.line(cumuls_selection, x='Jour', y='30 jours', color='Prénom et nom', template="plotly_dark",
+                                       title="Rapports d'intervention sur 30 jours glissants")
+                st.plotly_chart(fig_glissant, use_container_width=True)
+            with col_percentiles:
+                percentiles = percentiles_par_team(cumuls_periode).melt(id_vars=['Jour', 'Team'], var_name='Percentile', value_name='30 jours')
+                fig_percentiles = px.line(percentiles, x='Jour', y='30 jours', color='Team', line_dash='Percentile', template="plotly_dark",
+                                          title="Distribution par team (p10 / p50 / p90, 30 jours glissants, opérateurs actifs sur 90 jours)")
+                st.plotly_chart(fig_percentiles, use_container_width=True)
+
+            st.write(f"### Indicateurs glissants au {derniers_cumuls['Jour'].max().date()} et variation hebdomadaire "
+                     f"(du {debut_semaine.date()} au {fin_semaine.date()}, comparée aux 7 jours précédents)")
+            st.dataframe(tableau_kpi.drop(columns='Jour'), use_container_width=True)
 
         # Affichage des tableaux
         # Assurez-vous que le chemin est correct et relatif au script
         script_dir = os.path.dirname(__file__)
         st.subheader(f"Tirage au sort de {nombre_lignes} lignes par opérateur")
-        df_filtre = df_principal[(df_principal[col_date].dt.date >= debut_periode) & (df_principal[col_date].dt.date <= fin_periode)]
+        df_filtre = selectionner(entrepot, filtres=filtres_graph)
 
         for operateur in operateurs_selectionnes:
             st.write(f"### Tirage pour {operateur}:")
             df_operateur = df_filtre[df_filtre[col_prenom_nom] == operateur]
-            lignes_tirees = df_operateur.sample(n=min(nombre_lignes, len(df_operateur)))
+            lignes_tirees = df_operateur.sample(n=min(nombre_lignes, len(df_operateur)), random_state=analyse['graine'])
             if not lignes_tirees.empty:
                 for _, ligne in lignes_tirees.iterrows():
                     col_info, col_photo = st.columns([3, 1])
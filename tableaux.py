@@ -0,0 +1,35 @@
+import math
+import streamlit as st
+from entrepot import colonnes, selectionner, nombre_lignes
+
+# Fonction pour afficher un tableau page par page, le filtre, le tri et la pagination étant faits côté serveur.
+# `source` est un entrepôt (ou un DataFrame) : seule la page visible est lue et envoyée au navigateur
+# (fragment : changer de page, de tri ou de filtre ne réexécute que le tableau)
+@st.fragment
+def afficher_tableau_pagine(source, cle, filtres=None, lignes_par_page=50):
+    col_filtre, col_tri, col_ordre = st.columns([2, 2, 1])
+    with col_filtre:
+        texte = st.text_input("Filtrer", key=f"{cle}_filtre")
+    with col_tri:
+        colonne_tri = st.selectbox("Trier par", [None] + colonnes(source),
+                                   format_func=lambda c: "Aucun tri" if c is None else str(c), key=f"{cle}_tri")
+    with col_ordre:
+        croissant = st.radio("Ordre", ["Croissant", "Décroissant"], key=f"{cle}_ordre") == "Croissant"
+
+    total = nombre_lignes(source, filtres=filtres, recherche=texte)
+    nombre_pages = max(1, math.ceil(total / lignes_par_page))
+
+    # La page courante vit dans l'état de session (le widget est créé sans valeur par défaut),
+    # ramenée dans les bornes si le filtre a réduit le nombre de pages
+    cle_page = f"{cle}_page"
+    st.session_state[cle_page] = min(st.session_state.get(cle_page, 1), nombre_pages)
+    page = st.number_input(f"Page (sur {nombre_pages})", min_value=1, max_value=nombre_pages, step=1, key=cle_page)
+
+    debut = (page - 1) * lignes_par_page
+    ordre = None if colonne_tri is None else (colonne_tri, croissant)
+    page_affichee = selectionner(source, filtres=filtres, recherche=texte, ordre=ordre, limite=lignes_par_page, decalage=debut)
+    st.dataframe(page_affichee, use_container_width=True)
+    if total:
+        st.caption(f"Lignes {debut + 1} à {min(debut + lignes_par_page, total)} sur {total}")
+    else:
+        st.caption("Aucune ligne ne correspond au filtre.")